@@ -0,0 +1,33 @@
+"""
+Generate _active_prompt.py: the CURRENT_VERSION prompt as a single string literal.
+
+prompts.py imports SYSTEM_PROMPT from the generated module when its version
+matches CURRENT_VERSION and the recorded size/mtime still match
+prompt_versions/<version>.txt, and falls back to reading the .txt otherwise.
+Re-run after changing CURRENT_VERSION or editing the active prompt text (the
+Docker image runs it at build time).
+
+Usage:
+    python build_prompt.py
+"""
+from pathlib import Path
+
+from prompts import CURRENT_VERSION, PROMPT_VERSIONS, prompt_stamp
+
+OUTPUT_FILE = Path(__file__).resolve().parent / "_active_prompt.py"
+
+
+def main() -> None:
+    prompt = PROMPT_VERSIONS[CURRENT_VERSION]()
+    OUTPUT_FILE.write_text(
+        "# Generated by build_prompt.py - do not edit.\n"
+        f"PROMPT_VERSION = {CURRENT_VERSION!r}\n"
+        f"PROMPT_STAMP = {prompt_stamp(CURRENT_VERSION)!r}\n"
+        f"SYSTEM_PROMPT = {prompt!r}\n",
+        encoding="utf-8",
+    )
+    print(f"Wrote {OUTPUT_FILE.name} ({CURRENT_VERSION}, {len(prompt)} chars)")
+
+
+if __name__ == "__main__":
+    main()
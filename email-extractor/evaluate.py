@@ -1,14 +1,16 @@
-import json
 import logging
 import sys
 import os
+import operator
+from array import array
+import ijson
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Iterable, Dict, Any
 
 # Configure Logging
 logging.basicConfig(
@@ -35,6 +37,9 @@ FIELDS_TO_EVALUATE = [
     "is_dangerous"
 ]
 
+# Precompiled (field, getter) pairs so the hot loop avoids rebuilding lookups per field
+FIELD_GETTERS = tuple((field, operator.methodcaller("get", field)) for field in FIELDS_TO_EVALUATE)
+
 def normalize_value(value: Any) -> Any:
     if isinstance(value, str):
         return value.strip().lower()
@@ -43,63 +48,57 @@ def normalize_value(value: Any) -> Any:
     return value
 
 def compare_values(pred: Any, truth: Any) -> bool:
-    norm_pred = normalize_value(pred)
-    norm_truth = normalize_value(truth)
-    
-    # Null handling
-    if norm_pred is None and norm_truth is None:
+    # Fast paths: identical objects (incl. both None), then null handling
+    if pred is truth:
         return True
-    if norm_pred is None or norm_truth is None:
+    if pred is None or truth is None:
         return False
-        
-    return norm_pred == norm_truth
 
-def evaluate(ground_truth: List[Dict], predictions: List[Dict]):
+    # Same-typed values that normalize_value leaves untouched (bool, int) compare directly
+    if type(pred) is type(truth) and not isinstance(pred, (str, float)):
+        return pred == truth
+
+    return normalize_value(pred) == normalize_value(truth)
+
+def evaluate(ground_truth: Iterable[Dict], predictions: Iterable[Dict]):
+    """
+    Compare predictions against ground truth field by field.
+    Only the ground truth is indexed up front; predictions are consumed one
+    record at a time and each matched pair is discarded once scored.
+    """
     gt_map = {item["id"]: item for item in ground_truth}
-    pred_map = {item["id"]: item for item in predictions}
 
-    correct_counts = {field: 0 for field in FIELDS_TO_EVALUATE}
-    total_counts = {field: 0 for field in FIELDS_TO_EVALUATE}
-    
-    total_fields_evaluated = 0
-    total_fields_correct = 0
+    # Positional counters aligned with FIELD_GETTERS; every field of a matched
+    # record is evaluated, so a single record count serves as the per-field total
+    correct_counts = array('l', [0] * len(FIELD_GETTERS))
+    records_evaluated = 0
 
-    for email_id, gt_data in gt_map.items():
-        if email_id not in pred_map:
-            logger.warning(f"Missing prediction for {email_id}")
+    for pred_data in predictions:
+        gt_data = gt_map.pop(pred_data.get("id"), None)
+        if gt_data is None:
             continue
-            
-        pred_data = pred_map[email_id]
-        
-        for field in FIELDS_TO_EVALUATE:
-            gt_val = gt_data.get(field)
-            pred_val = pred_data.get(field)
-            
-            is_correct = compare_values(pred_val, gt_val)
-            
-            if is_correct:
-                correct_counts[field] += 1
-                total_fields_correct += 1
-            else:
-                 # Optional: Log mismatches for debugging
-                 # logger.debug(f"Mismatch {email_id} {field}: Pred={pred_val}, Truth={gt_val}")
-                 pass
-            
-            total_counts[field] += 1
-            total_fields_evaluated += 1
+
+        for idx, (_, getter) in enumerate(FIELD_GETTERS):
+            correct_counts[idx] += compare_values(getter(pred_data), getter(gt_data))
+
+        records_evaluated += 1
+
+    for email_id in gt_map:
+        logger.warning(f"Missing prediction for {email_id}")
 
     logger.info("------ Evaluation Metrics ------")
-    for field in FIELDS_TO_EVALUATE:
-        correct = correct_counts[field]
-        total = total_counts[field]
+    for idx, (field, _) in enumerate(FIELD_GETTERS):
+        correct = correct_counts[idx]
+        total = records_evaluated
         if total > 0:
             accuracy = (correct / total) * 100
         else:
             accuracy = 0.0
         logger.info(f"{field}: {accuracy:.2f}% ({correct}/{total})")
     
+    total_fields_evaluated = records_evaluated * len(FIELD_GETTERS)
     if total_fields_evaluated > 0:
-        overall_accuracy = (total_fields_correct / total_fields_evaluated) * 100
+        overall_accuracy = (sum(correct_counts) / total_fields_evaluated) * 100
     else:
         overall_accuracy = 0.0
         
@@ -112,13 +111,10 @@ def main():
         logger.error(f"Output file not found: {OUTPUT_FILE}")
         sys.exit(1)
         
-    with open(GROUND_TRUTH_FILE, 'r') as f:
-        ground_truth = json.load(f)
-        
-    with open(OUTPUT_FILE, 'r') as f:
-        predictions = json.load(f)
-        
-    evaluate(ground_truth, predictions)
+    with open(GROUND_TRUTH_FILE, 'rb') as gt_file, open(OUTPUT_FILE, 'rb') as pred_file:
+        ground_truth = ijson.items(gt_file, 'item', use_float=True)
+        predictions = ijson.items(pred_file, 'item', use_float=True)
+        evaluate(ground_truth, predictions)
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,38 @@
 import os
+import argparse
+import asyncio
+import hashlib
 import json
 import logging
+import mmap
 import time
 import sys
 import re
-from typing import List, Dict, Optional
+import sqlite3
+from itertools import islice
+from collections import deque, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, List, Dict, Optional, Sequence, Tuple, Union
 from pathlib import Path
 
-from groq import Groq, RateLimitError, APITimeoutError, APIError
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient, RateLimitError, APITimeoutError, APIError
 from dotenv import load_dotenv
 from tqdm import tqdm
-from pydantic import ValidationError
+from pydantic import TypeAdapter, ValidationError
 
-from schemas import ExtractionResult, ProductLine, Incoterm
-from prompts import SYSTEM_PROMPT
+from schemas import ExtractionResult, ProductLine, Incoterm, IMPORT_IN, EXPORT_IN, llm_response_schema
+from prompts import SYSTEM_PROMPT, BATCH_INSTRUCTIONS, strip_output_schema
+from preprocess import parse_simple_email, multi_shipment_ports, is_dangerous_goods, cargo_quantities
 
-# Configure Logging
+# Configure Logging (WARNING by default; set LOG_LEVEL=INFO or DEBUG for per-email detail)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -31,18 +46,153 @@ DATA_DIR = Path("/data") if Path("/data").exists() else Path("..")
 INPUT_FILE = Path(os.getenv("INPUT_FILE", str(DATA_DIR / "emails_input.json")))
 PORT_CODES_FILE = Path(os.getenv("PORT_CODES_FILE", str(DATA_DIR / "port_codes_reference.json")))
 OUTPUT_FILE = Path(os.getenv("OUTPUT_FILE", str(DATA_DIR / "output.json")))
+# Append-only journal of completed results (one JSON object per line).
+# A rerun after a crash resumes from it; it is removed once output.json is written.
+JOURNAL_FILE = OUTPUT_FILE.with_suffix(".ndjson")
+JOURNAL_FLUSH_EVERY = int(os.getenv("JOURNAL_FLUSH_EVERY", "10"))
+# On-disk cache of validated model responses (empty string disables it)
+CACHE_FILE = os.getenv("CACHE_FILE", str(OUTPUT_FILE.with_name("cache.db")))
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME")
 TEMPERATURE = 0.0
 
+# Concurrency / rate limiting
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "16"))
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))
+# Tokens reserved for the model's reply when estimating a request against GROQ_TPM
+RESPONSE_TOKEN_ESTIMATE = 200
+# Emails packed into one completion request (1 = one request per email)
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+# Groq Batch API (--batch): completion window and seconds between status polls
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+# Extract trivially parseable emails with regex rules instead of the LLM
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() == "true"
+# Constrain single-email replies with a strict JSON schema (Groq structured
+# outputs; the model must support json_schema). Batched replies stay json_object.
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "false").lower() == "true"
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter shared by all concurrent requests.
+    Keeps a deque of recent (timestamp, amount) entries and waits until a new
+    acquisition fits within `max_calls` per `period` seconds. Each acquisition
+    counts 1 by default; pass an amount to budget tokens instead of calls.
+    """
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls: deque = deque()
+        self._used = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1) -> None:
+        # A single request larger than the whole budget waits for an empty window
+        amount = min(amount, self.max_calls)
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0][0] >= self.period:
+                    self._used -= self._calls.popleft()[1]
+                if self._used + amount <= self.max_calls:
+                    self._calls.append((now, amount))
+                    self._used += amount
+                    return
+                await asyncio.sleep(self.period - (now - self._calls[0][0]))
+
+
+rate_limiter = RateLimiter(GROQ_RPM)
+# Optional tokens-per-minute budget alongside the RPM limit (GROQ_TPM=0 disables it)
+token_limiter = RateLimiter(GROQ_TPM) if GROQ_TPM > 0 else None
+
+
+def estimate_tokens(messages: Sequence[Dict]) -> int:
+    """Rough request size for TPM budgeting: ~4 characters per token plus reply headroom."""
+    return sum(len(message["content"]) for message in messages) // 4 + RESPONSE_TOKEN_ESTIMATE
+
+
+class ResponseCache:
+    """
+    SQLite key/value store of raw model responses, keyed by a blake2b hash of
+    (MODEL_NAME, single-email system prompt, subject, body). Only responses that passed
+    validation are stored, so a hit can skip the Groq call entirely on reruns.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+
+    @staticmethod
+    def make_key(subject: str, body: str) -> str:
+        return hashlib.blake2b(f"{MODEL_NAME}|{SYSTEM_MSG['content']}|{subject}|{body}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+# Compiled once; validate_python skips the per-call **kwargs construction path.
+# ExtractionResult has no nested models or extras, so vars() of a validated
+# instance is already the model_dump() dict (same keys, order and values) and
+# is used instead of re-serializing; the throwaway instance is never reused.
+_EXTRACTION_ADAPTER = TypeAdapter(ExtractionResult)
+
+# System messages are identical for every request; build them once and share them.
+# With structured outputs the schema travels in response_format, so the
+# single-email prompt drops its prose "Output Schema" section.
+SYSTEM_MSG = {
+    "role": "system",
+    "content": strip_output_schema(SYSTEM_PROMPT) if STRUCTURED_OUTPUT else SYSTEM_PROMPT,
+}
+BATCH_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT + BATCH_INSTRUCTIONS}
+
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "extraction", "schema": llm_response_schema(), "strict": True},
+} if STRUCTURED_OUTPUT else JSON_OBJECT_FORMAT
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON with orjson when available, falling back to the stdlib."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj: Any) -> bytes:
+    """Serialize to 2-space indented UTF-8 JSON with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode("utf-8")
+
+def json_dumps_line(obj: Any) -> bytes:
+    """Serialize to a single compact JSON line (newline-terminated)."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj).encode("utf-8") + b"\n"
+
 def load_json(path: Path):
     if not path.exists():
         logger.error(f"File not found: {path}")
         sys.exit(1)
-    with open(path, 'r') as f:
-        return json.load(f)
-
+    with open(path, 'rb') as f:
+        if orjson is None or os.fstat(f.fileno()).st_size == 0:
+            return json_loads(f.read())
+        # Let orjson parse straight from the page cache instead of copying the file into a bytes object
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return orjson.loads(view)
+
+@lru_cache(maxsize=None)
 def normalize_port_name(name: str) -> str:
     """
     Normalize a port name for flexible matching.
@@ -56,20 +206,35 @@ def normalize_port_name(name: str) -> str:
     return "|".join(parts)
 
 
-def create_port_mapping(port_codes_data: List[Dict]) -> tuple[Dict[str, str], Dict[str, str], Dict[str, List[str]], Dict[str, List[str]]]:
+@dataclass(frozen=True, slots=True)
+class PortIndex:
     """
-    Creates four mappings:
-    1. name_to_code: Exact name -> first code found
-    2. normalized_to_code: Normalized name -> first code found  
-    3. name_to_all_codes: Exact name -> list of ALL codes
-    4. normalized_to_all_codes: Normalized name -> list of ALL codes
+    Port lookup tables built once from port_codes_reference.json:
+    - name_to_all_codes: Exact name -> list of ALL codes (first listed code first)
+    - normalized_to_all_codes: Normalized name -> list of ALL codes
+    - name_to_codes_by_country: Exact name -> {country prefix -> codes}
+    - normalized_to_codes_by_country: Normalized name -> {country prefix -> codes}
+    - code_to_name: UN/LOCODE -> first name listed for it (reverse index)
+    """
+    name_to_all_codes: Dict[str, List[str]]
+    normalized_to_all_codes: Dict[str, List[str]]
+    name_to_codes_by_country: Dict[str, Dict[str, List[str]]]
+    normalized_to_codes_by_country: Dict[str, Dict[str, List[str]]]
+    code_to_name: Dict[str, str]
+
+
+def create_port_mapping(port_codes_data: List[Dict]) -> PortIndex:
+    """
+    Build the PortIndex in one pass over the reference data.
     
-    The "all_codes" mappings allow country-preference filtering when multiple codes exist.
+    The "all_codes" mappings allow country-preference filtering when multiple codes exist;
+    the "by_country" buckets make that preference a direct lookup instead of a scan.
+    The primary code for a name is simply name_to_all_codes[name][0].
     """
-    name_to_code: Dict[str, str] = {}
-    normalized_to_code: Dict[str, str] = {}
-    name_to_all_codes: Dict[str, List[str]] = {}
-    normalized_to_all_codes: Dict[str, List[str]] = {}
+    # Ordered sets (dict keys) give O(1) dedup while keeping first-seen code order
+    name_to_code_set: Dict[str, Dict[str, None]] = defaultdict(dict)
+    normalized_to_code_set: Dict[str, Dict[str, None]] = defaultdict(dict)
+    code_to_name: Dict[str, str] = {}
     
     for item in port_codes_data:
         code = item.get("code", "").strip()
@@ -78,48 +243,67 @@ def create_port_mapping(port_codes_data: List[Dict]) -> tuple[Dict[str, str], Di
         if not code or not name:
             continue
         
-        upper_name = name.upper()
-        normalized_name = normalize_port_name(name)
-        
-        # First occurrence as default
-        if upper_name not in name_to_code:
-            name_to_code[upper_name] = code
-        if normalized_name not in normalized_to_code:
-            normalized_to_code[normalized_name] = code
+        # Intern keys and codes so every mapping (and every code list) shares one string object
+        code = sys.intern(code)
+        upper_name = sys.intern(name.upper())
+        normalized_name = sys.intern(normalize_port_name(name))
         
         # Track ALL codes for each name
-        if upper_name not in name_to_all_codes:
-            name_to_all_codes[upper_name] = []
-        if code not in name_to_all_codes[upper_name]:
-            name_to_all_codes[upper_name].append(code)
-            
-        if normalized_name not in normalized_to_all_codes:
-            normalized_to_all_codes[normalized_name] = []
-        if code not in normalized_to_all_codes[normalized_name]:
-            normalized_to_all_codes[normalized_name].append(code)
+        name_to_code_set[upper_name][code] = None
+        normalized_to_code_set[normalized_name][code] = None
+        code_to_name.setdefault(code, name)
+
+    name_to_all_codes = {k: list(v) for k, v in name_to_code_set.items()}
+    normalized_to_all_codes = {k: list(v) for k, v in normalized_to_code_set.items()}
             
-    return name_to_code, normalized_to_code, name_to_all_codes, normalized_to_all_codes
+    return PortIndex(
+        name_to_all_codes=name_to_all_codes,
+        normalized_to_all_codes=normalized_to_all_codes,
+        name_to_codes_by_country=bucket_codes_by_country(name_to_all_codes),
+        normalized_to_codes_by_country=bucket_codes_by_country(normalized_to_all_codes),
+        code_to_name=code_to_name
+    )
+
+
+def bucket_codes_by_country(all_codes: Dict[str, List[str]]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Group each name's codes by their 2-letter UN/LOCODE country prefix,
+    preserving the original code order within each bucket.
+    """
+    by_country: Dict[str, Dict[str, List[str]]] = {}
+    for name, codes in all_codes.items():
+        buckets: Dict[str, List[str]] = defaultdict(list)
+        for code in codes:
+            buckets[code[:2]].append(code)
+        by_country[name] = dict(buckets)
+    return by_country
 
 
 def find_port_code(
     port_name: str, 
     name_to_all_codes: Dict[str, List[str]], 
     normalized_to_all_codes: Dict[str, List[str]],
-    country_prefix: Optional[str] = None
+    country_prefix: Optional[str] = None,
+    name_to_codes_by_country: Optional[Dict[str, Dict[str, List[str]]]] = None,
+    normalized_to_codes_by_country: Optional[Dict[str, Dict[str, List[str]]]] = None
 ) -> Optional[str]:
     """
     Find port code by trying exact match first, then normalized match.
     If multiple codes exist for a name, prefer codes matching the country_prefix.
+    When the by-country buckets are supplied the preference is a direct lookup.
     """
     upper_name = port_name.upper()
-    normalized_name = normalize_port_name(port_name)
     
-    # Get all matching codes (try exact first, then normalized)
+    # Get all matching codes (try exact first, then normalized).
+    # Normalization (split/sort/join) only runs when the exact lookup misses.
     codes = name_to_all_codes.get(upper_name, [])
+    lookup_key, codes_by_country = upper_name, name_to_codes_by_country
     if not codes:
+        normalized_name = normalize_port_name(port_name)
         codes = normalized_to_all_codes.get(normalized_name, [])
+        lookup_key, codes_by_country = normalized_name, normalized_to_codes_by_country
         if codes:
-            logger.info(f"Matched '{port_name}' via normalized lookup")
+            logger.info("Matched '%s' via normalized lookup", port_name)
     
     if not codes:
         return None
@@ -130,16 +314,58 @@ def find_port_code(
     
     # Multiple codes exist - prefer country_prefix match
     if country_prefix:
-        matching = [c for c in codes if c.startswith(country_prefix.upper())]
+        country_prefix = country_prefix.upper()
+        if codes_by_country is not None:
+            matching = codes_by_country.get(lookup_key, {}).get(country_prefix)
+        else:
+            matching = [c for c in codes if c.startswith(country_prefix)]
         if matching:
-            logger.info(f"Multiple codes for '{port_name}': {codes}. Selected '{matching[0]}' (matches {country_prefix} prefix)")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Multiple codes for '%s': %s. Selected '%s' (matches %s prefix)",
+                    port_name, codes, matching[0], country_prefix
+                )
             return matching[0]
     
     # No preference or no match - return first
-    logger.info(f"Multiple codes for '{port_name}': {codes}. Using first: '{codes[0]}'")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Multiple codes for '%s': %s. Using first: '%s'", port_name, codes, codes[0])
     return codes[0]
 
 
+@dataclass(frozen=True, slots=True)
+class PortLookup:
+    """
+    Port resolution bound to one PortIndex:
+    - find: (upper-case port name, country prefix) -> port code, memoized
+    - code_to_name: UN/LOCODE -> canonical reference name (reverse index)
+    """
+    find: Callable[[str, Optional[str]], Optional[str]]
+    code_to_name: Dict[str, str]
+
+
+def build_port_lookup(port_index: PortIndex) -> PortLookup:
+    """
+    Bind the port index once and return a memoized find_port_code.
+    lru_cache cannot key on the mapping dicts, so they are closed over here and
+    the cache is keyed only on (upper-case name, country prefix).
+    A "name" that is itself a reference UN/LOCODE (e.g. the LLM echoing
+    "CNSZX") resolves to that code via the reverse index.
+    """
+    @lru_cache(maxsize=4096)
+    def _cached_find(upper_name: str, country_prefix: Optional[str]) -> Optional[str]:
+        code = find_port_code(
+            upper_name, port_index.name_to_all_codes, port_index.normalized_to_all_codes,
+            country_prefix, port_index.name_to_codes_by_country,
+            port_index.normalized_to_codes_by_country
+        )
+        if code is None and upper_name in port_index.code_to_name:
+            return upper_name
+        return code
+
+    return PortLookup(find=_cached_find, code_to_name=port_index.code_to_name)
+
+
 # Port code to name mapping for common codes that LLM might return
 PORT_CODE_TO_NAME = {
     "PUS": "Busan",
@@ -162,6 +388,8 @@ PORT_CODE_TO_NAME = {
     "HAM": "Hamburg",
     "DAM": "Dammam",
     "RUH": "Riyadh",
+    "CNSZX": "Shenzhen",
+    "LGB": "Long Beach",
 }
 
 
@@ -206,6 +434,9 @@ def normalize_port_name_display(port_name: str) -> str:
                 for word in words:
                     if word.upper() == 'ICD':
                         title_words.append('ICD')
+                    elif word.upper() in PORT_CODE_TO_NAME:
+                        # "MAA ICD" -> "Chennai ICD"; the part already carries its ICD
+                        title_words.append(PORT_CODE_TO_NAME[word.upper()].removesuffix(' ICD'))
                     else:
                         title_words.append(word.title())
                 part = ' '.join(title_words)
@@ -214,170 +445,538 @@ def normalize_port_name_display(port_name: str) -> str:
         
         normalized_parts.append(part)
     
-    # Join with " / " (space-slash-space)
-    return " / ".join(normalized_parts)
+    # Join with " / " (space-slash-space). Interned so every result naming the
+    # same port shares one string instead of holding its own copy.
+    return sys.intern(" / ".join(normalized_parts))
+
+
+# (name field, code field, direction flag under which that side is India, log label).
+# Exports FROM India have an Indian origin; imports TO India an Indian destination.
+PORT_FIELDS = (
+    ("origin_port_name", "origin_port_code", EXPORT_IN, "origin"),
+    ("destination_port_name", "destination_port_code", IMPORT_IN, "destination"),
+)
 
 
 def post_process_result(
-    result: ExtractionResult, 
-    name_to_all_codes: Dict[str, List[str]],
-    normalized_to_all_codes: Dict[str, List[str]]
-) -> ExtractionResult:
+    data: Dict, 
+    port_lookup: PortLookup
+) -> Dict:
     """
     Apply business rules and normalization.
     Uses product_line to determine country context for port selection.
+
+    Operates on the already-validated, dumped result dict: the fields written
+    here are plain strings, so the Pydantic model is not mutated or re-dumped.
     """
     
-    # Normalize port names first (Title Case, spacing, etc.)
-    if result.origin_port_name:
-        result.origin_port_name = normalize_port_name_display(result.origin_port_name)
+    # Determine country context based on product_line. No None guard: the
+    # schema makes product_line required, so a validated result always has one.
+    flags = data["product_line"].direction_flags
     
-    if result.destination_port_name:
-        result.destination_port_name = normalize_port_name_display(result.destination_port_name)
-    
-    # Determine country context based on product_line
-    is_import_to_india = result.product_line == "pl_sea_import_lcl"
-    is_export_from_india = result.product_line == "pl_sea_export_lcl"
-    
-    # Look up Origin Port Code from Name
-    if result.origin_port_name:
-        # For exports FROM India, origin should be Indian port (IN prefix)
-        origin_prefix = "IN" if is_export_from_india else None
-        logging.info(f"Looking up origin code for: {result.origin_port_name} (prefer: {origin_prefix})")
-        result.origin_port_code = find_port_code(
-            result.origin_port_name, name_to_all_codes, normalized_to_all_codes, origin_prefix
-        )
-    else:
-        result.origin_port_code = None
-
-    # Look up Destination Port Code from Name  
-    if result.destination_port_name:
-        # For imports TO India, destination should be Indian port (IN prefix)
-        dest_prefix = "IN" if is_import_to_india else None
-        logging.info(f"Looking up destination code for: {result.destination_port_name} (prefer: {dest_prefix})")
-        result.destination_port_code = find_port_code(
-            result.destination_port_name, name_to_all_codes, normalized_to_all_codes, dest_prefix
-        )
-    else:
-        result.destination_port_code = None
+    for name_field, code_field, india_flag, label in PORT_FIELDS:
+        # Normalize the port name first (Title Case, spacing, etc.)
+        name = data[name_field]
+        if name:
+            name = data[name_field] = normalize_port_name_display(name)
+
+        # Look up the port code from the name, preferring Indian codes on the India side
+        if name:
+            prefix = "IN" if flags & india_flag else None
+            logger.info("Looking up %s code for: %s (prefer: %s)", label, name, prefix)
+            code = data[code_field] = port_lookup.find(name.upper(), prefix)
+            # A reference code echoed as the name ("CNNSA") takes that code's canonical name
+            if code is not None and name.upper() == code:
+                data[name_field] = port_lookup.code_to_name[code]
+        else:
+            data[code_field] = None
 
-    return result
+    return data
 
 
 
-def process_email(
-    client: Groq, 
-    email_data: Dict, 
-    name_to_all_codes: Dict[str, List[str]],
-    normalized_to_all_codes: Dict[str, List[str]]
-) -> Optional[Dict]:
-    email_id = email_data.get("id")
-    subject = email_data.get("subject", "")
-    body = email_data.get("body", "")
-    
-    user_content = f"""
-    Subject: {subject}
-    Body: {body}
+async def complete_with_retry(
+    client: AsyncGroq,
+    messages: Sequence[Dict],
+    label: str,
+    response_format: Dict = RESPONSE_FORMAT
+) -> Optional[str]:
+    """
+    Send one chat completion through the shared rate limiter, backing off
+    exponentially on rate-limit/timeout errors. Returns the raw message
+    content, or None once retries are exhausted. Other API errors propagate.
     """
-
     retries = 3
     base_delay = 2
 
     for attempt in range(retries):
         try:
-            logger.debug(f"Processing {email_id} - Attempt {attempt + 1}")
-            completion = client.chat.completions.create(
+            logger.debug("Processing %s - Attempt %d", label, attempt + 1)
+            await rate_limiter.acquire()
+            if token_limiter is not None:
+                await token_limiter.acquire(estimate_tokens(messages))
+            completion = await client.chat.completions.create(
                 model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_content}
-                ],
+                messages=messages,
                 temperature=TEMPERATURE,
-                response_format={"type": "json_object"}
+                response_format=response_format
             )
-            
-            response_content = completion.choices[0].message.content
-            logger.info(f"Raw Response for {email_id}: {response_content}")
-
-            parsed_data = json.loads(response_content)
-            
-            # Inject ID if missing (though Prompt asks to return without ID, we can add it)
-            parsed_data["id"] = email_id
-            
-            # Validate with Pydantic
-            result = ExtractionResult(**parsed_data)
-            
-            # Post Process with country-aware port code selection
-            final_result = post_process_result(result, name_to_all_codes, normalized_to_all_codes)
-            
-            return final_result.model_dump()
+            return completion.choices[0].message.content
 
         except (RateLimitError, APITimeoutError) as e:
             wait_time = base_delay * (2 ** attempt)
-            logger.warning(f"API Error processing {email_id}: {e}. Retrying in {wait_time}s...")
-            time.sleep(wait_time)
-        except ValidationError as e:
-            logger.error(f"Validation Error for {email_id}: {e}")
-            # If validation fails, we might want to return a null-filled object or retry?
-            # README says: "include it in output.json with null for all extracted fields".
-            return None
-        except json.JSONDecodeError as e:
-             logger.error(f"JSON Parse Error for {email_id}: {e}")
-             return None
-        except Exception as e:
-            logger.error(f"Unexpected Error processing {email_id}: {e}")
-            return None
-    
-    logger.error(f"Failed to process {email_id} after {retries} retries.")
+            logger.warning("API Error processing %s: %s. Retrying in %ss...", label, e, wait_time)
+            await asyncio.sleep(wait_time)
+
+    logger.error("Failed to process %s after %d retries.", label, retries)
     return None
 
-def main():
-    logging.info(f"Groq API key : {GROQ_API_KEY}")
+
+def build_extraction(email_id: str, parsed_data: Dict, port_lookup: PortLookup) -> Dict:
+    """Validate one parsed LLM extraction and apply post-processing."""
+    # Inject ID if missing (though Prompt asks to return without ID, we can add it)
+    parsed_data["id"] = email_id
+    
+    # Validate once with Pydantic, then work on a plain dict
+    data = vars(_EXTRACTION_ADAPTER.validate_python(parsed_data))
+    
+    # Post Process with country-aware port code selection
+    return post_process_result(data, port_lookup)
+
+
+def try_fast_path(email_data: Dict, port_lookup: PortLookup) -> Optional[Dict]:
+    """
+    Extract an email without the LLM when preprocess.parse_simple_email can.
+    Both ports must resolve to codes and exactly one side must be Indian to
+    fix the product line; otherwise None is returned and the LLM is used.
+    """
+    def primary_code(name: str) -> Optional[str]:
+        return port_lookup.find(normalize_port_name_display(name).upper(), None)
+
+    fields = parse_simple_email(
+        email_data.get("subject", ""), email_data.get("body", ""),
+        lambda name: primary_code(name) is not None
+    )
+    if fields is None:
+        return None
+
+    origin_in = primary_code(fields["origin_port_name"]).startswith("IN")
+    destination_in = primary_code(fields["destination_port_name"]).startswith("IN")
+    if origin_in == destination_in:
+        return None
+    fields["product_line"] = (
+        ProductLine.EXPORT_LCL.value if origin_in else ProductLine.IMPORT_LCL.value
+    )
+
+    try:
+        return build_extraction(email_data.get("id"), fields, port_lookup)
+    except ValidationError as e:
+        logger.warning("Fast path result for %s failed validation: %s", email_data.get("id"), e)
+        return None
+
+
+def build_user_content(email_data: Dict) -> str:
+    # Compact "Subject/Body" layout, shared by single, batched and Batch API requests.
+    # Multi-shipment ports and converted lbs/tonnes/RT quantities are worked out
+    # in Python and passed as a leading hint line.
+    body = email_data.get('body', '')
+    content = f"Subject: {email_data.get('subject', '')}\nBody: {body}"
+    hints = []
+    ports = multi_shipment_ports(body, normalize_port_name_display)
+    if ports is not None:
+        hints.append(f'origin_port_name="{ports[0]}", destination_port_name="{ports[1]}"')
+    quantities = cargo_quantities(body)
+    if quantities is not None:
+        weight, cbm = (json.dumps(value) for value in quantities)
+        hints.append(f"cargo_weight_kg={weight}, cargo_cbm={cbm}")
+    if not hints:
+        return content
+    return f"Hint: {', '.join(hints)}\n{content}"
+
+
+def parse_response(
+    email_id: Any,
+    response_content: str,
+    port_lookup: PortLookup
+) -> Optional[Dict]:
+    """
+    Parse, validate and post-process one model response. Returns None on failure
+    so the caller can fall back to a null-filled record.
+    """
+    logger.debug("Raw Response for %s: %s", email_id, response_content)
+    try:
+        # Validate the raw JSON text directly (no intermediate dict), then set the ID
+        data = vars(_EXTRACTION_ADAPTER.validate_json(response_content))
+        data["id"] = email_id
+        return post_process_result(data, port_lookup)
+
+    except ValidationError as e:
+        # Also covers malformed JSON (error type "json_invalid")
+        logger.error("Validation Error for %s: %s", email_id, e)
+        # If validation fails, we might want to return a null-filled object or retry?
+        # README says: "include it in output.json with null for all extracted fields".
+        return None
+    except Exception as e:
+        logger.error("Unexpected Error processing %s: %s", email_id, e)
+        return None
+
+
+async def process_email(
+    client: AsyncGroq, 
+    email_data: Dict, 
+    port_lookup: PortLookup,
+    cache: Optional[ResponseCache] = None
+) -> Optional[Dict]:
+    """
+    Extract one email with a single completion request (or the response cache).
+    Requests go through AsyncGroq natively; do not swap in the sync Groq client
+    wrapped in asyncio.to_thread, which adds a thread-pool hop per call and
+    caps concurrency at the executor's worker count.
+    """
+    email_id = email_data.get("id")
+
+    cache_key = None
+    if cache is not None:
+        cache_key = ResponseCache.make_key(email_data.get("subject", ""), email_data.get("body", ""))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Cache hit for %s", email_id)
+            return parse_response(email_id, cached, port_lookup)
+
+    try:
+        response_content = await complete_with_retry(
+            client,
+            (SYSTEM_MSG, {"role": "user", "content": build_user_content(email_data)}),
+            email_id
+        )
+    except Exception as e:
+        logger.error("Unexpected Error processing %s: %s", email_id, e)
+        return None
+    if response_content is None:
+        return None
+
+    result = parse_response(email_id, response_content, port_lookup)
+    if result is not None and cache_key is not None:
+        cache.set(cache_key, response_content)
+    return result
+
+
+async def process_batch(
+    client: AsyncGroq,
+    batch: List[Dict],
+    port_lookup: PortLookup,
+    cache: Optional[ResponseCache] = None
+) -> List[Optional[Dict]]:
+    """
+    Extract several emails with a single completion request.
+    Emails are sent as "###EMAIL <n>" sections and the model returns
+    {"results": [{"index": n, ...}, ...]}. Entries are validated one by one;
+    emails whose entry is missing or invalid are retried on their own through
+    process_email (and its response cache). If the response as a whole cannot
+    be parsed, the batch is split in half and retried.
+    """
+    if len(batch) == 1:
+        return [await process_email(client, batch[0], port_lookup, cache)]
+
+    label = f"batch {batch[0].get('id')}..{batch[-1].get('id')}"
+    user_content = "\n".join(
+        f"###EMAIL {n}\n{build_user_content(email)}"
+        for n, email in enumerate(batch, start=1)
+    )
+
+    try:
+        response_content = await complete_with_retry(
+            client,
+            (BATCH_SYSTEM_MSG, {"role": "user", "content": user_content}),
+            label,
+            JSON_OBJECT_FORMAT
+        )
+        if response_content is None:
+            return [None] * len(batch)
+        logger.debug("Raw Response for %s: %s", label, response_content)
+
+        entries = json_loads(response_content)["results"]
+        by_index = {entry.pop("index", None): entry for entry in entries}
+
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        # JSONDecodeError is a ValueError; split and retry
+        logger.warning("Could not use response for %s (%s). Splitting batch...", label, e)
+        mid = len(batch) // 2
+        first, second = await asyncio.gather(
+            process_batch(client, batch[:mid], port_lookup, cache),
+            process_batch(client, batch[mid:], port_lookup, cache)
+        )
+        return first + second
+    except Exception as e:
+        logger.error("Unexpected Error processing %s: %s", label, e)
+        return [None] * len(batch)
+
+    results: List[Optional[Dict]] = [None] * len(batch)
+    retry: List[int] = []
+    for pos, email in enumerate(batch):
+        entry = by_index.get(pos + 1)
+        if entry is None:
+            logger.warning("No entry for %s in %s. Retrying alone...", email.get("id"), label)
+            retry.append(pos)
+            continue
+        try:
+            results[pos] = build_extraction(email.get("id"), entry, port_lookup)
+        except (ValueError, TypeError, AttributeError) as e:
+            # ValidationError is a ValueError
+            logger.warning("Unusable entry for %s in %s (%s). Retrying alone...", email.get("id"), label, e)
+            retry.append(pos)
+
+    if retry:
+        retried = await asyncio.gather(*(
+            process_email(client, batch[pos], port_lookup, cache) for pos in retry
+        ))
+        for pos, result in zip(retry, retried):
+            results[pos] = result
+    return results
+
+async def run_batch_api_job(
+    client: AsyncGroq,
+    emails: List[Dict],
+    port_lookup: PortLookup
+) -> List[Optional[Dict]]:
+    """
+    Extract all emails through the Groq Batch API instead of per-email completions.
+    Each email becomes one /v1/chat/completions line in an uploaded JSONL file
+    (custom_id = its input position); the job is polled until it finishes and the
+    output lines are validated and post-processed exactly like online responses.
+    Batch jobs are not counted against the online RPM limit.
+    """
+    results: List[Optional[Dict]] = [None] * len(emails)
+
+    requests_jsonl = b"".join(
+        json_dumps_line({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODEL_NAME,
+                "messages": [SYSTEM_MSG, {"role": "user", "content": build_user_content(email)}],
+                "temperature": TEMPERATURE,
+                "response_format": RESPONSE_FORMAT,
+            },
+        })
+        for i, email in enumerate(emails)
+    )
+    input_file = await client.files.create(
+        file=("batch_input.jsonl", requests_jsonl), purpose="batch"
+    )
+    job = await client.batches.create(
+        completion_window=BATCH_COMPLETION_WINDOW,
+        endpoint="/v1/chat/completions",
+        input_file_id=input_file.id,
+    )
+    logger.info(f"Submitted batch job {job.id} with {len(emails)} requests.")
+
+    while job.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        job = await client.batches.retrieve(job.id)
+        logger.info(f"Batch job {job.id}: {job.status}")
+
+    if not job.output_file_id:
+        logger.error(f"Batch job {job.id} ended as '{job.status}' without an output file.")
+        return results
+
+    output = await client.files.content(job.output_file_id)
+    for line in (await output.read()).splitlines():
+        if not line.strip():
+            continue
+        record = json_loads(line)
+        i = int(record["custom_id"])
+        email_id = emails[i].get("id")
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.error("Batch request failed for %s: %s", email_id, record.get("error") or response)
+            continue
+        try:
+            response_content = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            logger.error("Malformed batch response for %s: %s", email_id, e)
+            continue
+        results[i] = parse_response(email_id, response_content, port_lookup)
+
+    return results
+
+# Fields of the output record for an email that could not be extracted (besides "id")
+_NULL_RESULT_TEMPLATE = {
+    "product_line": None,
+    "origin_port_code": None,
+    "origin_port_name": None,
+    "destination_port_code": None,
+    "destination_port_name": None,
+    "incoterm": None,
+    "cargo_weight_kg": None,
+    "cargo_cbm": None,
+    "is_dangerous": False
+}
+
+def load_journal() -> Dict[Any, Dict]:
+    """
+    Read results journaled by an interrupted run, keyed by email ID.
+    A partially written trailing line (crash mid-write) is ignored.
+    """
+    journaled: Dict[Any, Dict] = {}
+    if not JOURNAL_FILE.exists():
+        return journaled
+    with open(JOURNAL_FILE, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json_loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable journal line in {JOURNAL_FILE}")
+                continue
+            journaled[record.get("id")] = record
+    return journaled
+
+def save_results(results: List[Optional[Dict]]) -> None:
+    """
+    Write completed results (input order, unfinished slots skipped) to OUTPUT_FILE.
+    The array is written to a temp file and atomically swapped in with os.replace,
+    so a crash mid-write never leaves a truncated output.json behind.
+    """
+    tmp_file = OUTPUT_FILE.with_suffix(".json.tmp")
+    tmp_file.write_bytes(json_dumps([result for result in results if result is not None]))
+    os.replace(tmp_file, OUTPUT_FILE)
+
+async def main(use_batch_api: bool = False):
     if not GROQ_API_KEY:
         logger.error("GROQ_API_KEY not found in environment variables.")
         sys.exit(1)
 
-    client = Groq(api_key=GROQ_API_KEY)
-
     logger.info("Loading Data...")
     emails = load_json(INPUT_FILE)
     port_codes = load_json(PORT_CODES_FILE)
     
-    name_to_code, normalized_to_code, name_to_all_codes, normalized_to_all_codes = create_port_mapping(port_codes)
-    logger.info(f"Loaded {len(emails)} emails and {len(name_to_code)} port name entries.")
+    port_index = create_port_mapping(port_codes)
+    logger.info(f"Loaded {len(emails)} emails and {len(port_index.name_to_all_codes)} port name entries.")
+    port_lookup = build_port_lookup(port_index)
+
+    # One slot per input email, filled by position as requests complete
+    results: List[Optional[Dict]] = [None] * len(emails)
+
+    # Resume: reuse results journaled by a previous, interrupted run
+    journaled = load_journal()
+    for i, email in enumerate(emails):
+        results[i] = journaled.get(email.get("id"))
+    if journaled:
+        logger.info(f"Resuming from {JOURNAL_FILE}: {len(emails) - results.count(None)} emails already done.")
+
+    if FAST_PATH:
+        fast = 0
+        for i, email in enumerate(emails):
+            if results[i] is None:
+                results[i] = try_fast_path(email, port_lookup)
+                fast += results[i] is not None
+        logger.info(f"Extracted {fast} simple emails without the LLM.")
+
+    # Identical (subject, body) emails are extracted once; each copy then
+    # receives that result under its own id (see record_results)
+    pending = []
+    duplicates: Dict[int, List[int]] = {}
+    first_seen: Dict[Tuple[str, str], int] = {}
+    for i, result in enumerate(results):
+        if result is None:
+            first = first_seen.setdefault((emails[i].get("subject", ""), emails[i].get("body", "")), i)
+            if first == i:
+                pending.append(i)
+            else:
+                duplicates.setdefault(first, []).append(i)
+    if duplicates:
+        logger.info(f"Skipping {sum(map(len, duplicates.values()))} duplicate emails.")
+
+    index_iter = iter(pending)
+    batches = list(iter(lambda: list(islice(index_iter, BATCH_SIZE)), []))
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    cache = ResponseCache(CACHE_FILE) if CACHE_FILE else None
+
+    # One pooled client for every request. Keep-alive covers all concurrent
+    # requests (the SDK default keeps 20) and outlives the gaps the rate limiter inserts.
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max(64, MAX_CONCURRENCY),
+            max_keepalive_connections=MAX_CONCURRENCY,
+            keepalive_expiry=60.0
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+
+    async with AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client) as client:
+        with open(JOURNAL_FILE, 'ab') as journal, \
+                tqdm(total=len(emails), initial=len(emails) - results.count(None), desc="Processing Emails") as progress:
+            unflushed = 0
+            if journal.tell():
+                # Terminate any partial line left by a crash before appending
+                journal.write(b"\n")
+
+            def record_results(indices: List[int], batch_results: List[Optional[Dict]]) -> None:
+                # Runs on the event loop thread, so journal writes never interleave
+                nonlocal unflushed
+                done = 0
+                for i, result in zip(indices, batch_results):
+                    if result:
+                        # Dangerous goods are classified by keyword rules, not by the model
+                        email = emails[i]
+                        result["is_dangerous"] = is_dangerous_goods(email.get("subject", ""), email.get("body", ""))
+                    for j in (i, *duplicates.get(i, ())):
+                        done += 1
+                        if result:
+                            results[j] = result if j == i else {**result, "id": emails[j].get("id")}
+                            # Journal successful results only, so a resumed run retries failures
+                            journal.write(json_dumps_line(results[j]))
+                            unflushed += 1
+                        else:
+                            # Fallback for failed extraction: preserve ID, nulls elsewhere
+                            results[j] = {"id": emails[j].get("id"), **_NULL_RESULT_TEMPLATE}
+                # Batch the flushes; the JSON array is written once at the end
+                if unflushed >= JOURNAL_FLUSH_EVERY:
+                    journal.flush()
+                    unflushed = 0
+                progress.update(done)
+
+            async def run_batch(indices: List[int]) -> None:
+                batch = [emails[i] for i in indices]
+                async with semaphore:
+                    batch_results = await process_batch(client, batch, port_lookup, cache)
+                record_results(indices, batch_results)
+
+            if use_batch_api:
+                logger.info(f"Starting Extraction via the Groq Batch API ({len(pending)} requests)...")
+                if pending:
+                    pending_emails = [emails[i] for i in pending]
+                    record_results(pending, await run_batch_api_job(client, pending_emails, port_lookup))
+            else:
+                logger.info(
+                    f"Starting Extraction with {MAX_CONCURRENCY} concurrent requests ({GROQ_RPM} RPM), "
+                    f"{len(batches)} requests of up to {BATCH_SIZE} emails..."
+                )
+                await asyncio.gather(*(run_batch(indices) for indices in batches))
 
-    results = []
-    
-    logger.info("Starting Extraction...")
-    for i, email in enumerate(tqdm(emails, desc="Processing Emails")):
-        result = process_email(client, email, name_to_all_codes, normalized_to_all_codes)
-        # logging.info(f"Input email : {email} \n Output data : {result} ")
-        if result:
-            results.append(result)
-        else:
-            # Fallback for failed extraction: preserve ID, nulls elsewhere
-            results.append({
-                "id": email.get("id"),
-                "product_line": None,
-                "origin_port_code": None,
-                "origin_port_name": None,
-                "destination_port_code": None,
-                "destination_port_name": None,
-                "incoterm": None,
-                "cargo_weight_kg": None,
-                "cargo_cbm": None,
-                "is_dangerous": False
-            })
-        
-        # Save incrementally every 5 emails
-        # if (i + 1) % 5 == 0:
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(results, f, indent=2)
+    if cache is not None:
+        cache.close()
+
+    # Every input email should have a slot filled (extracted or null fallback)
+    unfinished = results.count(None)
+    if unfinished:
+        logger.error(f"{unfinished} of {len(emails)} emails have no result and will be missing from the output.")
 
     logger.info(f"Extraction complete. Saving final results to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(results, f, indent=2)
+    save_results(results)
+    # output.json now holds everything; the next run starts from scratch
+    JOURNAL_FILE.unlink(missing_ok=True)
     logger.info("Done.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Extract shipment details from emails.")
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Submit all emails as one Groq Batch API job instead of online completions"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(use_batch_api=args.batch))
@@ -0,0 +1,201 @@
+"""
+Rule-based pre-processing of email text.
+
+parse_simple_email handles the short, unambiguous enquiries
+("3 cbm LCL Bangkok to Chennai.", "DG LCL HOU→MAA. UN 1105, 350 KG/0.9 CBM.")
+without the LLM. Anything outside its
+narrow rules returns None and goes to the model as usual.
+
+is_dangerous_goods decides is_dangerous from keywords, replacing the
+prompt's DG rules.
+
+cargo_quantities converts lbs / tonnes / RT quantities to kg and CBM,
+passed to the model as a hint instead of asking it to do the arithmetic.
+
+multi_shipment_ports splits "JED→MAA ICD 1.9 cbm; DAM→BLR ICD 3 RT" style
+bodies into their combined origins and destinations, passed to the model
+as a hint instead of teaching it the aggregation in the prompt.
+"""
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from schemas import Incoterm
+
+# Exactly one of these may appear in the body: a single origin -> destination pair
+ROUTE_SEPARATOR = re.compile(r"\s*(?:→|->|\bto\b)\s*", re.IGNORECASE)
+
+CBM_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*cbm\b", re.IGNORECASE)
+KG_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*kgs?\b", re.IGNORECASE)
+INCOTERM_PATTERN = re.compile(r"\b(" + "|".join(term.value for term in Incoterm) + r")\b")
+
+# Dangerous-goods keywords; is_dangerous_goods strips negations ("non-DG") first
+DG_PATTERN = re.compile(
+    r"\b(?:DG|dangerous|hazardous|IMO|IMDG|UN\s*\d{4}|Class\s*\d)", re.IGNORECASE
+)
+NON_DG_PATTERN = re.compile(
+    r"\b(?:non[\s-]?|not\s+)(?:DG|hazardous|dangerous)\b", re.IGNORECASE
+)
+
+# Multi-shipment, transshipment, alternative ports, RT / unit conversions,
+# dimensions, thousand separators and null markers all need the LLM's rules.
+# A slash is only allowed between a unit and a number ("400 KG/1.1 CBM").
+COMPLEX_PATTERN = re.compile(
+    r"[;()]|(?<![A-Za-z])/|/(?!\d)|\d,\d|\d\s*[x*×]\s*\d"
+    r"|\b(?:via|ex|or|and|final|RT|MT|tons?|tonnes?|lbs?|TBD|N/?A)\b",
+    re.IGNORECASE
+)
+
+# Words that may sit directly before the origin or after the destination
+ROUTE_FILLERS = {"LCL", "FCL", "CBM", "KG", "KGS", "FROM", "NEED", "RATE", "PPG", "CCL"}
+ROUTE_FILLERS.update(term.value for term in Incoterm)
+
+# One "ORIGIN→DESTINATION <cargo>" shipment, optionally numbered ("1) ...")
+SHIPMENT_PATTERN = re.compile(
+    r"^\s*(?:\d+\)\s*)?([A-Za-z][A-Za-z ]*?)\s*(?:→|->)\s*([A-Za-z][A-Za-z ]*?)\s*(?=[\d:,]|$)"
+)
+SHIPMENT_SEPARATOR = re.compile(r"\s*;\s*")
+
+# Quantity with its unit; thousand separators ("1,260 KGS") are allowed
+QUANTITY_PATTERN = re.compile(
+    r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*(lbs?|kgs?|mt|tonnes?|tons?|rt|cbm)\b",
+    re.IGNORECASE
+)
+# kg per unit of each weight unit
+WEIGHT_UNITS = {
+    "kg": 1.0, "kgs": 1.0,
+    "lb": 0.453592, "lbs": 0.453592,
+    "mt": 1000.0, "tonne": 1000.0, "tonnes": 1000.0, "ton": 1000.0, "tons": 1000.0,
+}
+CONVERTED_UNITS = {"lb", "lbs", "mt", "tonne", "tonnes", "ton", "tons", "rt"}
+
+MAX_PORT_WORDS = 3
+_PUNCTUATION = ",.:!?"
+
+
+def is_dangerous_goods(subject: str, body: str) -> bool:
+    """
+    True if the email mentions dangerous goods: "DG", "dangerous", "hazardous",
+    "IMO", "IMDG", "UN" + 4 digits or "Class" + digit. Negated mentions
+    ("non-DG", "non-hazardous", "not dangerous") are removed before matching.
+    """
+    return DG_PATTERN.search(NON_DG_PATTERN.sub(" ", f"{subject}\n{body}")) is not None
+
+
+def _is_filler(token: str) -> bool:
+    word = token.strip(_PUNCTUATION)
+    return not word or word.upper() in ROUTE_FILLERS or word.replace(".", "", 1).isdigit()
+
+
+def _port_before(text: str, is_port: Callable[[str], bool]) -> Optional[str]:
+    """Longest run of trailing words that is a known port and follows a filler word."""
+    tokens = text.split()
+    for size in range(min(MAX_PORT_WORDS, len(tokens)), 0, -1):
+        words = tokens[-size:]
+        if any(word[-1] in _PUNCTUATION for word in words):
+            continue
+        candidate = " ".join(words)
+        if is_port(candidate) and (size == len(tokens) or _is_filler(tokens[-size - 1])):
+            return candidate
+    return None
+
+
+def _port_after(text: str, is_port: Callable[[str], bool]) -> Optional[str]:
+    """Longest run of leading words that is a known port and ends the clause."""
+    tokens = text.split()
+    for size in range(min(MAX_PORT_WORDS, len(tokens)), 0, -1):
+        words = tokens[:size]
+        if any(word[-1] in _PUNCTUATION for word in words[:-1]):
+            continue
+        candidate = " ".join(words).rstrip(_PUNCTUATION)
+        ends_clause = words[-1][-1] in _PUNCTUATION or size == len(tokens) or _is_filler(tokens[size])
+        if ends_clause and is_port(candidate):
+            return candidate
+    return None
+
+
+def _numbers(pattern: re.Pattern, text: str) -> List[float]:
+    return [round(float(value), 2) for value in pattern.findall(text)]
+
+
+def parse_simple_email(
+    subject: str,
+    body: str,
+    is_port: Callable[[str], bool]
+) -> Optional[Dict]:
+    """
+    Extract fields from a trivially parseable email, or return None.
+    `is_port` decides whether a name (or code) is a known port. The returned
+    dict has raw port names and no product_line; the caller resolves both.
+    """
+    text = body.strip()
+    if not text or COMPLEX_PATTERN.search(text):
+        return None
+
+    route = ROUTE_SEPARATOR.split(text)
+    if len(route) != 2:
+        return None
+    origin = _port_before(route[0], is_port)
+    destination = _port_after(route[1], is_port)
+    if origin is None or destination is None:
+        return None
+
+    cbm = _numbers(CBM_PATTERN, text)
+    weight = _numbers(KG_PATTERN, text)
+    incoterms = set(INCOTERM_PATTERN.findall(f"{subject} {text}"))
+    if len(cbm) > 1 or len(weight) > 1 or len(incoterms) > 1:
+        return None
+
+    return {
+        "origin_port_name": origin,
+        "destination_port_name": destination,
+        "incoterm": incoterms.pop() if incoterms else Incoterm.FOB.value,
+        "cargo_weight_kg": weight[0] if weight else None,
+        "cargo_cbm": cbm[0] if cbm else None,
+        "is_dangerous": is_dangerous_goods(subject, body),
+    }
+
+
+def cargo_quantities(body: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """
+    (cargo_weight_kg, cargo_cbm) from the first weight and first CBM in the
+    body, or None when no quantity needs converting (plain kg / CBM bodies are
+    left to the model). "X RT" on its own gives X CBM and X * 1000 kg.
+    """
+    quantities = [(float(value.replace(",", "")), unit.lower()) for value, unit in QUANTITY_PATTERN.findall(body)]
+    if not any(unit in CONVERTED_UNITS for _, unit in quantities):
+        return None
+
+    weight = next((value * WEIGHT_UNITS[unit] for value, unit in quantities if unit in WEIGHT_UNITS), None)
+    cbm = next((value for value, unit in quantities if unit == "cbm"), None)
+    if weight is None and cbm is None:
+        revenue_tons = next(value for value, unit in quantities if unit == "rt")
+        weight, cbm = revenue_tons * 1000, revenue_tons
+    return (
+        round(weight, 2) if weight is not None else None,
+        round(cbm, 2) if cbm is not None else None,
+    )
+
+
+def multi_shipment_ports(
+    body: str,
+    expand: Callable[[str], str]
+) -> Optional[Tuple[str, str]]:
+    """
+    Combined (origins, destinations) of a semicolon-separated multi-shipment
+    body, each " / "-joined in order of first appearance, or None when the
+    body is not made up only of simple shipments. `expand` turns each raw
+    port (code or name) into its display name.
+    """
+    segments = [segment for segment in SHIPMENT_SEPARATOR.split(body.strip().rstrip(".")) if segment]
+    if len(segments) < 2:
+        return None
+
+    origins: Dict[str, None] = {}
+    destinations: Dict[str, None] = {}
+    for segment in segments:
+        match = SHIPMENT_PATTERN.match(segment)
+        if match is None:
+            return None
+        origins[expand(match.group(1))] = None
+        destinations[expand(match.group(2))] = None
+    return " / ".join(origins), " / ".join(destinations)
@@ -3,34 +3,33 @@ Prompt Versioning System for Email Extraction
 
 This module maintains versioned prompts for the freight email extraction system.
 Each version documents improvements and changes from the previous iteration.
+The prompt texts live in prompt_versions/<version>.txt and are read on first
+use, so only the active version is ever loaded. build_prompt.py can bake the
+active version into _active_prompt.py, which SYSTEM_PROMPT then uses.
 
 Usage:
     from prompts import get_current_prompt, CURRENT_VERSION
     
     prompt = get_current_prompt()  # Gets the latest active prompt
 """
+import logging
+import sys
+from functools import lru_cache, partial
+from pathlib import Path
+from types import MappingProxyType
+from typing import Tuple
+
+PROMPT_DIR = Path(__file__).resolve().parent / "prompt_versions"
 
 # Current active version - change this to switch prompt versions
-CURRENT_VERSION = "v4"
+CURRENT_VERSION = "v9"
 
 # =============================================================================
 # Version 1: Basic Extraction
 # Accuracy: ~88%
 # Issues: Port codes wrong, missing incoterms, India detection failing
 # =============================================================================
-PROMPT_V1 = """You are a logistics data extractor. Extract shipment details from freight forwarding emails into a structured JSON format.
-
-Return a JSON object with the following fields:
-- product_line: "pl_sea_import_lcl" if destination is India, "pl_sea_export_lcl" if origin is India
-- origin_port_name: Origin port/city name as mentioned in the email, or null
-- destination_port_name: Destination port/city name as mentioned in the email, or null
-- incoterm: Shipping term, or null if not mentioned
-- cargo_weight_kg: Weight in kilograms, or null
-- cargo_cbm: Volume in cubic meters, or null
-- is_dangerous: true if cargo is dangerous goods, false otherwise
-
-Extract values exactly as mentioned in the email. Use null for missing or unclear values.
-"""
+# Text: prompt_versions/v1.txt
 
 # =============================================================================
 # Version 2: Added UN/LOCODE Examples
@@ -38,457 +37,152 @@ Extract values exactly as mentioned in the email. Use null for missing or unclea
 # Improvement: Added explicit UN/LOCODE format, incoterm defaults
 # Issues: India detection failing for ICD ports, product line inconsistent
 # =============================================================================
-PROMPT_V2 = """You are a logistics data extractor. Extract shipment details from freight forwarding emails into a structured JSON format.
-
-### Output Schema
-
-Return a JSON object with the following fields:
-- product_line: "pl_sea_import_lcl" if destination is India, "pl_sea_export_lcl" if origin is India
-- origin_port_name: Origin port/city name as mentioned in the email, or null
-- destination_port_name: Destination port/city name as mentioned in the email, or null
-- incoterm: Shipping term (FOB, CIF, CFR, EXW, DDP, DAP, FCA, CPT, CIP, DPU), default to "FOB" if not mentioned
-- cargo_weight_kg: Weight in kilograms (convert from lbs/tonnes if needed), or null
-- cargo_cbm: Volume in cubic meters, or null
-- is_dangerous: true if cargo is dangerous goods, false otherwise
-
-### Port Code Format
-Port codes follow UN/LOCODE format: 5 letters (2-letter country + 3-letter location)
-Examples: HKHKG (Hong Kong), INMAA (Chennai), CNSHA (Shanghai)
-
-### Rules
-- Extract values exactly as mentioned in the email
-- Use null for missing or unclear values
-- Default incoterm to "FOB" if not specified
-
-Example Output:
-{
-  "product_line": "pl_sea_import_lcl",
-  "origin_port_name": "Hong Kong",
-  "destination_port_name": "Chennai",
-  "incoterm": "FOB",
-  "cargo_weight_kg": 500.0,
-  "cargo_cbm": 5.0,
-  "is_dangerous": false
-}
-"""
+# Text: prompt_versions/v2.txt
 
 # =============================================================================
 # Version 3: Explicit Business Rules (CURRENT)
 # Accuracy: 94%
 # Improvement: India detection via IN prefix, conflict resolution, unit conversions, Adding some examples
 # =============================================================================
-PROMPT_V3 = """You are a logistics data extractor for freight forwarding emails. Extract shipment details into structured JSON format. Always give more priority to body instead of subject of the email.
-
-### Output Schema
-
-Return a JSON object with these fields:
-- product_line: "pl_sea_import_lcl" if destination is India, "pl_sea_export_lcl" if origin is India
-- origin_port_name: Origin port/city name as mentioned in the email, or null, if multiple then keep separated with a '/' with their full name
-- destination_port_name: Destination port/city name as mentioned in the email, or null if multiple then keep separated with a '/' with their full name
-- incoterm: Shipping term (FOB, CIF, CFR, EXW, DDP, DAP, FCA, CPT, CIP, DPU), default to "FOB" if not mentioned or ambiguous
-- cargo_weight_kg: Weight in kilograms rounded to 2 decimals, or null
-- cargo_cbm: Volume in cubic meters rounded to 2 decimals, or null
-- is_dangerous: true if dangerous goods, false otherwise
-
-### Business Rules
-
-**India Detection:**
-- Indian ports have UN/LOCODE starting with "IN" (e.g., INMAA Chennai, INNSA Nhava Sheva, INBLR Bangalore)
-- If destination is India → product_line = "pl_sea_import_lcl"
-- If origin is India → product_line = "pl_sea_export_lcl"
-
-**Incoterm Handling:**
-- Valid terms: FOB, CIF, CFR, EXW, DDP, DAP, FCA, CPT, CIP, DPU
-- If not mentioned or ambiguous (e.g., "FOB or CIF") → default to "FOB"
-
-**Dangerous Goods Detection:**
-- is_dangerous = true if: "DG", "dangerous", "hazardous", "Class X" (any number), "IMO", "IMDG"
-- is_dangerous = false if: "non-hazardous", "non-DG", "not dangerous"
-- is_dangerous = false if no mention
-
-**Conflict Resolution:**
-- Subject vs Body conflict → Body takes precedence
-- Multiple shipments → Extract first shipment only
-- Multiple ports → Use origin→destination pair, ignore transshipment ports
-
-**Unit Conversions:**
-- Weight in lbs → convert to kg: lbs * 0.453592, round to 2 decimals
-- Weight in tonnes/MT → convert to kg: tonnes * 1000
-- Dimensions (L*W*H) → extract as null for CBM (do not calculate)
-
-**Null Handling:**
-- "TBD", "N/A", "to be confirmed" → extract as null
-- Missing values → null (not 0 or "")
-- Explicit zero (e.g., "0 kg") → extract as 0
-
-### Example 1
-
-Input:
-{
-  "id": "EMAIL_005",
-  "subject": "Singapore to Chennai",
-  "body": "Non-stackable 1.1 cbm SIN \u2192 Chennai.",
-  "sender_email": "sin@sgco.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_005",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_code": "SGSIN",
-  "origin_port_name": "Singapore",
-  "destination_port_code": "INMAA",
-  "destination_port_name": "Chennai",
-  "cargo_weight_kg": null,
-  "cargo_cbm": 1.1,
-  "is_dangerous": false
-}
-
-### Example 2
-
-Input:
-{
-    "id": "EMAIL_006",
-    "subject": "LCL DG RFQ // SHA \u2192 MAA ICD",
-    "body": "Dear Priya, Requesting DG LCL import rates for a shipment ex SHA (Shanghai) to ICD MAA (final dest Chennai ICD). Cargo: UN 1993 Flammable Liquid NOS, PG II, packed 4 CMB UN-approved drums. Approx wt 1800 KGS / 3.8 CBM. Shipper insisting FCA SHA. Please confirm DG surcharge, MSDS reqs, CFS handling, dest THC + ICD handling. Regards, Kevin / CN Logistics.",
-    "sender_email": "kevin@cnlogistics.cn",
-    "to_emails": "[priya.impchn@globelinkww.com]",
-    "cc_emails": ""
-  }
-Output:
-{
-  "id": "EMAIL_006",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_code": "CNSHA",
-  "origin_port_name": "Shanghai",
-  "destination_port_code": "INMAA",
-  "destination_port_name": "Chennai ICD",
-  "cargo_weight_kg": 1800.0,
-  "cargo_cbm": 3.8,
-  "is_dangerous": true
-}
-
-### Example 3
-
-Input:
-{
-  "id": "EMAIL_007",
-  "subject": "LCL RFQ ex Saudi to India ICD",
-  "body": "JED\u2192MAA ICD 1.9 cbm; DAM\u2192BLR ICD 3 RT; RUH\u2192HYD ICD 850kg.",
-  "sender_email": "freight@ksa-logistics.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_007",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_code": "SAJED",
-  "origin_port_name": "Jeddah / Dammam / Riyadh",
-  "destination_port_code": "INMAA",
-  "destination_port_name": "Chennai ICD / Bangalore ICD / Hyderabad ICD",
-  "cargo_weight_kg": 850.0,
-  "cargo_cbm": 1.9,
-  "is_dangerous": false
-}
-
-
-"""
+# Text: prompt_versions/v3.txt
 
 # =============================================================================
 # Version 4: RT Handling, Code-to-Name, Multi-Item Fix (CURRENT)
 # Accuracy: 97.78
 # Improvement: RT conversion, port code expansion, first-item rule, port name cleaning
 # =============================================================================
-PROMPT_V4 = """You are a logistics data extractor for freight forwarding emails. Extract shipment details into structured JSON format. Always give more priority to body instead of subject of the email in case of any conflicting details.
-
-### Output Schema
-
-Return a JSON object with these fields:
-- product_line: "pl_sea_import_lcl" if destination is India, "pl_sea_export_lcl" if origin is India
-- origin_port_name: Origin port/city name as mentioned in the email, or null. If multiple ports, separate with " / " (space-slash-space). Use proper Title Case (e.g., "Shanghai", not "SHANGHAI")
-- destination_port_name: Destination port/city name as mentioned in the email, or null. If multiple ports, separate with " / " (space-slash-space). Use proper Title Case
-- incoterm: Shipping term (FOB, CIF, CFR, EXW, DDP, DAP, FCA, CPT, CIP, DPU), default to "FOB" if not mentioned or ambiguous
-- cargo_weight_kg: Weight in kilograms rounded to 2 decimals, or null
-- cargo_cbm: Volume in cubic meters rounded to 2 decimals, or null
-- is_dangerous: true if dangerous goods, false otherwise
-
-### Business Rules
-
-**India Detection:**
-- Indian ports have UN/LOCODE starting with "IN" (e.g., INMAA Chennai, INNSA Nhava Sheva, INBLR Bangalore)
-- If destination is India → product_line = "pl_sea_import_lcl"
-- If origin is India → product_line = "pl_sea_export_lcl"
-
-**Port Name Extraction:**
-- ALWAYS return full port NAMES, not codes
-- If email uses codes (PUS, MAA, SHA, BLR, etc.), convert to full names:
-  - PUS → Busan
-  - MAA → Chennai
-  - SHA → Shanghai  
-  - BLR → Bangalore ICD
-  - HYD → Hyderabad ICD
-  - JED → Jeddah
-  - SIN → Singapore
-  - HKG → Hong Kong
-  - DAM → Dammam
-  - RUH → Riyadh
-  - CNSZX → Shenzhen
-- Extract ONLY the port name. Do NOT append city/country context (e.g., "Ambarli" not "Ambarli, Istanbul")
-- For ICD ports, use consistent format: "[City] ICD" (e.g., "Chennai ICD", "Bangalore ICD")
-- Use " / " (space-slash-space) between multiple ports (e.g., "Xingang / Tianjin")
-- If origin is mentioned as country goods (e.g., "Japanese goods", "Chinese products"), extract the country name (e.g., "Japan", "China")
-
-**Multi-Shipment Emails (IMPORTANT):**
-- If email contains MULTIPLE SHIPMENTS separated by semicolons (;), combine ALL origins and ALL destinations:
-  - Example: "JED→MAA ICD; DAM→BLR ICD; RUH→HYD ICD" means:
-    - origin_port_name = "Jeddah / Dammam / Riyadh"
-    - destination_port_name = "Chennai ICD / Bangalore ICD / Hyderabad ICD"
-  - Take the FIRST weight/CBM mentioned for cargo values
-- This aggregation applies when the email lists multiple distinct origin→destination pairs
-
-**Transshipment vs Final Destination:**
-- When email mentions both POD (Port of Discharge) and "final destination" or "via [port]":
-  - Use the FINAL DESTINATION as destination_port_name, NOT the transshipment port
-  - Example: "HAM to ICD Whitefield, routed via Chennai" → destination = "ICD Whitefield"
-  - Example: "POD Laem Chabang; final destination ICD Bangkok" → destination = "Bangkok ICD"
-
-**Incoterm Handling:**
-- Valid terms: FOB, CIF, CFR, EXW, DDP, DAP, FCA, CPT, CIP, DPU
-- If not mentioned or ambiguous (e.g., "FOB or CIF") → default to "FOB"
-- If email says "CIF [port]", the incoterm is CIF
-
-**Revenue Ton (RT) Handling:**
-- RT (Revenue Ton) = the chargeable weight based on max(actual weight, volumetric weight)
-- When only "X RT" is mentioned without separate weight/CBM:
-  - Extract cargo_cbm = X (the RT value as CBM)
-  - Extract cargo_weight_kg = X * 1000 (RT value * 1000 as kg)
-- Example: "2.4 RT" → cargo_cbm = 2.4, cargo_weight_kg = 2400.0
-
-**Dangerous Goods Detection:**
-- is_dangerous = true if: "DG", "dangerous", "hazardous", "UN" followed by number, "Class X" (any number), "IMO", "IMDG"
-- is_dangerous = false if: "non-hazardous", "non-DG", "not dangerous"
-- is_dangerous = false if no mention
-
-**Conflict Resolution:**
-- Subject vs Body conflict → Body takes precedence
-- **Multiple DG items in same shipment → Extract ONLY the FIRST item's weight/CBM**
-- If body lacks origin/destination but subject has them → use subject information
-
-**Unit Conversions:**
-- Weight in lbs → convert to kg: lbs * 0.453592, round to 2 decimals
-- Weight in tonnes/MT → convert to kg: tonnes * 1000
-- Dimensions (L*W*H) → extract as null for CBM (do not calculate)
-
-**Null Handling:**
-- "TBD", "N/A", "to be confirmed" → extract as null
-- Missing values → null (not 0 or "")
-- Explicit zero (e.g., "0 kg") → extract as 0
+# Text: prompt_versions/v4.txt
 
-### Example 1
-
-Input:
-{
-  "id": "EMAIL_005",
-  "subject": "Singapore to Chennai",
-  "body": "Non-stackable 1.1 cbm SIN → Chennai.",
-  "sender_email": "sin@sgco.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_005",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Singapore",
-  "destination_port_name": "Chennai",
-  "cargo_weight_kg": null,
-  "cargo_cbm": 1.1,
-  "is_dangerous": false
-}
-
-### Example 2 (RT Handling)
-
-Input:
-{
-  "id": "EMAIL_024",
-  "subject": "Jebel Ali to Chennai ICD",
-  "body": "Need LCL rate 2.4 RT Jebel Ali → Chennai ICD.",
-  "sender_email": "ops@middleeast.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_024",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Jebel Ali",
-  "destination_port_name": "Chennai ICD",
-  "cargo_weight_kg": 2400.0,
-  "cargo_cbm": 2.4,
-  "is_dangerous": false
-}
-
-### Example 3 (Code to Name Conversion)
-
-Input:
-{
-  "id": "EMAIL_039",
-  "subject": "DG RFQ // PUS → MAA",
-  "body": "Dear Priya, UN 2735 Amines Liquid Corrosive, 410 KG/1.0 CBM from PUS→MAA. FOB PUS. Regards, Min.",
-  "sender_email": "min@korealog.kr",
-  "to_emails": "[priya.impchn@globelinkww.com]",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_039",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Busan",
-  "destination_port_name": "Chennai",
-  "cargo_weight_kg": 410.0,
-  "cargo_cbm": 1.0,
-  "is_dangerous": true
-}
-
-### Example 4 (Multi-Shipment Aggregation - IMPORTANT)
-
-Input:
-{
-  "id": "EMAIL_007",
-  "subject": "LCL RFQ ex Saudi to India ICD",
-  "body": "JED→MAA ICD 1.9 cbm; DAM→BLR ICD 3 RT; RUH→HYD ICD 850kg.",
-  "sender_email": "freight@ksa-logistics.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_007",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Jeddah / Dammam / Riyadh",
-  "destination_port_name": "Chennai ICD / Bangalore ICD / Hyderabad ICD",
-  "cargo_weight_kg": 850.0,
-  "cargo_cbm": 1.9,
-  "is_dangerous": false
-}
-
-### Example 5 (Transshipment - Use Final Destination)
+# =============================================================================
+# Version 5: Port Code Table Moved to Post-Processing
+# Accuracy: not re-measured (post-processing covers the removed table)
+# Improvement: drops the in-prompt code->name list; PORT_CODE_TO_NAME in extract.py expands codes
+# =============================================================================
+# Text: prompt_versions/v5.txt
 
-Input:
-{
-  "id": "EMAIL_019",
-  "subject": "ICD Whitefield via Chennai",
-  "body": "HAM to ICD WHITEFIELD, routed via Chennai. 3.5 cbm, 820 kg. FOB Hamburg.",
-  "sender_email": "pricing@euagent.com",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_019",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Hamburg",
-  "destination_port_name": "ICD Whitefield",
-  "cargo_weight_kg": 820.0,
-  "cargo_cbm": 3.5,
-  "is_dangerous": false
-}
+# =============================================================================
+# Version 6: Multi-Shipment Split in Python
+# Accuracy: not re-measured (hints reproduce the ground truth ports on the sample set)
+# Improvement: drops the aggregation rules and example; preprocess.py passes the ports as a hint
+# =============================================================================
+# Text: prompt_versions/v6.txt
 
-### Example 6 (POD vs Final Destination)
+# =============================================================================
+# Version 7: Dangerous Goods Classified in Python
+# Accuracy: not re-measured (keyword rules match is_dangerous on all 50 samples)
+# Improvement: drops the DG keyword rules; preprocess.is_dangerous_goods sets is_dangerous
+# =============================================================================
+# Text: prompt_versions/v7.txt
 
-Input:
-{
-  "id": "EMAIL_023",
-  "subject": "EXPORT LCL RFQ // Chennai to ICD Bangkok via Laem Chabang // Auto Parts",
-  "body": "Dear Priya, We need LCL export rate from Chennai to Bangkok ICD via Laem Chabang. POL Chennai, India; POD Laem Chabang, Thailand; final destination ICD Bangkok. Incoterm FOB Chennai. Commodity: auto parts, 1,260 KGS, 2.9 CBM, cartons, stackable.",
-  "sender_email": "pricing@autoindia.in",
-  "to_emails": "priya.impchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_023",
-  "product_line": "pl_sea_export_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Chennai",
-  "destination_port_name": "Bangkok ICD",
-  "cargo_weight_kg": 1260.0,
-  "cargo_cbm": 2.9,
-  "is_dangerous": false
-}
+# =============================================================================
+# Version 8: Unit Conversions in Python
+# Accuracy: not re-measured
+# Improvement: drops the RT and lbs/tonnes rules; preprocess.cargo_quantities
+#              passes converted weight/CBM as a hint
+# =============================================================================
+# Text: prompt_versions/v8.txt
 
-### Example 7 (Country-Based Origin)
+# =============================================================================
+# Version 9: Two Compact Examples (CURRENT)
+# Accuracy: not re-measured
+# Improvement: 8 JSON-formatted examples -> 2 in the real "Subject/Body" layout
+# =============================================================================
+# Text: prompt_versions/v9.txt
 
-Input:
-{
-  "id": "EMAIL_011",
-  "subject": "Return shipment to Chennai",
-  "body": "Return of Japanese goods back to Chennai, 1.8 cbm.",
-  "sender_email": "ops@return.com",
-  "to_emails": "sujatha.csvchn@globelinkww.com",
-  "cc_emails": ""
-}
-Output:
-{
-  "id": "EMAIL_011",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "FOB",
-  "origin_port_name": "Japan",
-  "destination_port_name": "Chennai",
-  "cargo_weight_kg": null,
-  "cargo_cbm": 1.8,
-  "is_dangerous": false
-}
+# =============================================================================
+# Batch Mode
+# Appended to the active prompt when several emails share one request
+# (BATCH_SIZE > 1 in extract.py). Each email keeps the per-email rules above.
+# =============================================================================
+BATCH_INSTRUCTIONS = """
 
-### Example 8 (Multi-DG - First Item Only)
+### Batch Mode
 
-Input:
+The user message contains several emails. Each one starts with a header line "###EMAIL <n>" followed by its Subject and Body.
+Apply every rule above to each email independently; never mix details between emails.
+Return a single JSON object of the form:
 {
-  "id": "EMAIL_022",
-  "subject": "MULTI DG RFQ // CNSZX → MAA",
-  "body": "Dear Team, two DG items in same shipment: UN 2920 Flammable Liquid 1.4 CBM/650 KG + UN 3109 Organic Peroxide 0.9 CBM/320 KG. POD MAA. CIF Shenzhen. Regards, Fang.",
-  "sender_email": "fang@supplysz.cn",
-  "to_emails": "[priya.impchn@globelinkww.com]",
-  "cc_emails": ""
+  "results": [
+    {"index": 1, "product_line": ..., "incoterm": ..., "origin_port_name": ..., "destination_port_name": ..., "cargo_weight_kg": ..., "cargo_cbm": ..., "is_dangerous": ...},
+    {"index": 2, ...}
+  ]
 }
-Output:
-{
-  "id": "EMAIL_022",
-  "product_line": "pl_sea_import_lcl",
-  "incoterm": "CIF",
-  "origin_port_name": "Shenzhen",
-  "destination_port_name": "Chennai",
-  "cargo_weight_kg": 650.0,
-  "cargo_cbm": 1.4,
-  "is_dangerous": true
-}
-
+with exactly one entry per email, where "index" is the number from that email's header.
 """
 
 # =============================================================================
 # Prompt Registry
 # =============================================================================
-PROMPT_VERSIONS = {
-    "v1": PROMPT_V1,
-    "v2": PROMPT_V2,
-    "v3": PROMPT_V3,
-    "v4": PROMPT_V4,
-}
-
+@lru_cache(maxsize=None)
+def _load(version: str) -> str:
+    """Read one prompt version from disk (once per process)."""
+    return (PROMPT_DIR / f"{version}.txt").read_text(encoding="utf-8")
+
+# Version -> loader; call the value to get the prompt text. Read-only: switch
+# versions through CURRENT_VERSION, not by editing the registry at runtime.
+PROMPT_VERSIONS = MappingProxyType({
+    "v1": partial(_load, "v1"),
+    "v2": partial(_load, "v2"),
+    "v3": partial(_load, "v3"),
+    "v4": partial(_load, "v4"),
+    "v5": partial(_load, "v5"),
+    "v6": partial(_load, "v6"),
+    "v7": partial(_load, "v7"),
+    "v8": partial(_load, "v8"),
+    "v9": partial(_load, "v9"),
+})
+
+def __getattr__(name: str) -> str:
+    # Keep PROMPT_V1..PROMPT_V4 importable; they now load on first access
+    if name.startswith("PROMPT_V") and f"v{name[8:]}" in PROMPT_VERSIONS:
+        return PROMPT_VERSIONS[f"v{name[8:]}"]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@lru_cache(maxsize=1)
 def get_current_prompt() -> str:
-    """Get the currently active prompt version."""
-    return PROMPT_VERSIONS[CURRENT_VERSION]
-
-# For backward compatibility - SYSTEM_PROMPT uses the current version
-SYSTEM_PROMPT = get_current_prompt()
+    """Get the currently active prompt version (resolved once, interned)."""
+    return sys.intern(PROMPT_VERSIONS[CURRENT_VERSION]())
+
+def strip_output_schema(prompt: str) -> str:
+    """
+    Remove the "### Output Schema" section, for requests that send the JSON
+    schema through structured outputs instead. Prompts without one (v1, v2)
+    are returned unchanged.
+    """
+    start = prompt.find("### Output Schema")
+    end = prompt.find("### ", start + 1)
+    if start == -1 or end == -1:
+        return prompt
+    return prompt[:start] + prompt[end:]
+
+def prompt_stamp(version: str) -> Tuple[int, int]:
+    """
+    (size, mtime_ns) of a version's source .txt, recorded by build_prompt.py.
+    A single stat() call, so checking a build for staleness never reads the file.
+    """
+    stat = (PROMPT_DIR / f"{version}.txt").stat()
+    return stat.st_size, stat.st_mtime_ns
+
+# For backward compatibility - SYSTEM_PROMPT uses the current version.
+# Prefer the literal generated by build_prompt.py; fall back to the .txt file
+# when it is missing, was built for another version, or the .txt changed since
+# (size or mtime differs from the build).
+try:
+    from _active_prompt import (
+        PROMPT_VERSION as _BUILT_VERSION,
+        PROMPT_STAMP as _BUILT_STAMP,
+        SYSTEM_PROMPT as _BUILT_PROMPT,
+    )
+except ImportError:
+    _BUILT_VERSION = _BUILT_STAMP = _BUILT_PROMPT = None
+
+if _BUILT_VERSION == CURRENT_VERSION and _BUILT_STAMP == prompt_stamp(CURRENT_VERSION):
+    SYSTEM_PROMPT = sys.intern(_BUILT_PROMPT)
+else:
+    if _BUILT_VERSION == CURRENT_VERSION:
+        logging.getLogger(__name__).warning(
+            "_active_prompt.py is stale (prompt_versions/%s.txt changed); "
+            "using the .txt file. Re-run build_prompt.py.", CURRENT_VERSION
+        )
+    SYSTEM_PROMPT = get_current_prompt()
 
@@ -1,11 +1,24 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field, field_validator
 from enum import Enum
 
+# Shipment direction relative to India, as bit flags
+IMPORT_IN = 1
+EXPORT_IN = 2
+
 class ProductLine(str, Enum):
     IMPORT_LCL = "pl_sea_import_lcl"
     EXPORT_LCL = "pl_sea_export_lcl"
 
+    @property
+    def direction_flags(self) -> int:
+        return _DIRECTION_FLAGS[self]
+
+_DIRECTION_FLAGS = {
+    ProductLine.IMPORT_LCL: IMPORT_IN,
+    ProductLine.EXPORT_LCL: EXPORT_IN,
+}
+
 class Incoterm(str, Enum):
     FOB = "FOB"
     CIF = "CIF"
@@ -18,20 +31,64 @@ class Incoterm(str, Enum):
     CIP = "CIP"
     DPU = "DPU"
 
+    @classmethod
+    def _missing_(cls, value):
+        # Case-insensitive lookup ("fob", "Cif") with a single dict get
+        if isinstance(value, str):
+            return cls._value2member_map_.get(value.upper())
+        return None
+
 class ExtractionResult(BaseModel):
-    id: str
-    product_line: Optional[ProductLine] = None
+    # Filled in by the extractor after validation; the model never returns it
+    id: Optional[str] = None
+    # Every shipment is to or from India, so the model must always pick one
+    product_line: ProductLine = Field(
+        description='"pl_sea_import_lcl" if destination is India, "pl_sea_export_lcl" if origin is India'
+    )
     origin_port_code: Optional[str] = None
-    origin_port_name: Optional[str] = None
+    origin_port_name: Optional[str] = Field(
+        None, description='Origin port name in Title Case; multiple ports joined with " / "'
+    )
     destination_port_code: Optional[str] = None
-    destination_port_name: Optional[str] = None
-    incoterm: Optional[Incoterm] = None
-    cargo_weight_kg: Optional[float] = None
-    cargo_cbm: Optional[float] = None
-    is_dangerous: bool = False
-
-    @field_validator('incoterm', mode='before')
-    def normalize_incoterm(cls, v):
-        if v:
-            return v.upper()
-        return v
+    destination_port_name: Optional[str] = Field(
+        None, description='Destination port name in Title Case; multiple ports joined with " / "'
+    )
+    incoterm: Incoterm = Field(Incoterm.FOB, description='Shipping term, "FOB" if not mentioned or ambiguous')
+    cargo_weight_kg: Optional[float] = Field(None, description="Weight in kg, rounded to 2 decimals")
+    cargo_cbm: Optional[float] = Field(None, description="Volume in cubic meters, rounded to 2 decimals")
+    is_dangerous: bool = Field(False, description="True if dangerous goods")
+
+    @field_validator("incoterm", mode="before")
+    @classmethod
+    def default_incoterm(cls, value):
+        # An explicit null means "not mentioned", which defaults to FOB
+        return Incoterm.FOB if value is None else value
+
+# Fields the model returns; ids and port codes are filled in after extraction
+LLM_FIELDS = (
+    "product_line", "incoterm", "origin_port_name", "destination_port_name",
+    "cargo_weight_kg", "cargo_cbm", "is_dangerous",
+)
+
+def llm_response_schema() -> Dict[str, Any]:
+    """
+    JSON schema of a single-email model reply, for strict structured outputs:
+    the LLM_FIELDS of ExtractionResult, all required, no extra keys.
+    """
+    schema = ExtractionResult.model_json_schema()
+    properties = {}
+    for name in LLM_FIELDS:
+        field = dict(schema["properties"][name])
+        field.pop("title", None)
+        field.pop("default", None)
+        # Non-optional enums come out as {"allOf": [{"$ref": ...}]}; inline the ref
+        if len(field.get("allOf", ())) == 1:
+            field.update(field.pop("allOf")[0])
+        properties[name] = field
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(LLM_FIELDS),
+        "additionalProperties": False,
+        "$defs": schema["$defs"],
+    }